@@ -5,49 +5,143 @@ SPDX-License-Identifier: GPLv2-or-later or Apache-2.0
 
 Extract captions from all figures in the NVMe specification
 """
-from itertools import chain
+from contextlib import suppress
+import hashlib
+import os
+import pickle
 import re
 import subprocess
+import tempfile
 
 from . import utils
 
-import xml.etree.ElementTree as ET
+from lxml import etree
 
 logger = utils.get_logger("Captions")
 
+# Version of the cached captions, bump it when the content of the cache changes
+cache_version = 1
+
+# Regex to find the figure number in a caption
+figure_number = re.compile(r"Figure (?P<number>\d+): .+")
+
+# XPath to find text elements with a bold child and the bold child itself
+text_with_bold = etree.XPath("descendant::text[b]")
+bold_child = etree.XPath("b[1]")
+
 
 def find_figures(file_path, ignore_path, target_path):
     """Find figures on every page"""
-    xml = subprocess.run(["pdftohtml", "-xml", "-stdout", "-i", file_path],
-                         stdout=subprocess.PIPE, text=True)
-    tree = ET.fromstring(xml.stdout)
-    pages = tree.findall(".//page")
     ignore = get_ignore(ignore_path)
     target = get_target(target_path)
     current_figure = 1
-    for page in pages:
-        if captions := extract_captions(page):
-            captions_text = list(get_text(captions))
-            current_figure, captions_to_skip = check_figure_number(
-                captions_text, current_figure, ignore, target)
-
-            # skip entire page if all captions should be skipped
-            if len(captions) != len(captions_to_skip):
-                for caption_number in captions_to_skip:
-                    captions_text[caption_number] = "skip"
-                yield page.get("number"), {"height": int(page.get("height")),
-                                           "captions": captions_text,
-                                           "top_coordinates": [get_top(caption)
-                                                               for caption in captions]
-                                           }
+    for page_number, height, captions, top_coordinates in read_pages(file_path):
+        current_figure, captions_to_skip = check_figure_number(
+            captions, current_figure, ignore, target)
+
+        # skip entire page if all captions should be skipped
+        if len(captions) != len(captions_to_skip):
+            # copy the captions so the cached pages are left untouched
+            captions = list(captions)
+            for caption_number in captions_to_skip:
+                captions[caption_number] = "skip"
+            yield page_number, {"height": height,
+                                "captions": captions,
+                                "top_coordinates": top_coordinates
+                                }
+
+
+def read_pages(file_path):
+    """Read captions from the cache if the file has been processed before,
+    otherwise extract them and cache them when every page has been read"""
+    try:
+        cache_file = utils.cache_path() / f"{file_digest(file_path)}-{cache_version}.pkl"
+    except OSError as e:
+        # the cache only saves time, the captions can still be extracted without it
+        logger.warning(f"Captions are not cached, the cache directory is unavailable: {e}")
+        cache_file = None
+
+    if cache_file is not None and cache_file.exists():
+        logger.debug(f"Reading captions from {cache_file}")
+        try:
+            with open(cache_file, "rb") as file:
+                pages = pickle.load(file)
+        except Exception as e:
+            # a broken cache is overwritten below
+            logger.warning(f"Ignoring unreadable cache {cache_file}: {e}")
+        else:
+            yield from pages
+            return
+
+    pages = []
+    try:
+        for page in extract_pages(file_path):
+            pages.append(page)
+            yield page
+    except subprocess.CalledProcessError as e:
+        # pdftohtml may have stopped before the last page, so the pages aren't cached
+        logger.warning(f"The captions may be incomplete: {e}")
+        return
+
+    if cache_file is not None:
+        write_cache(cache_file, pages)
+
+
+def write_cache(cache_file, pages):
+    """Write pages to the cache, a failed write is logged and otherwise ignored"""
+    temporary_file = None
+    try:
+        # write to a unique temporary file first, so an interrupted or concurrent run can't leave a broken cache
+        with tempfile.NamedTemporaryFile(dir=cache_file.parent, suffix=".tmp", delete=False) as file:
+            temporary_file = file.name
+            pickle.dump(pages, file)
+        os.replace(temporary_file, cache_file)
+        temporary_file = None
+    except OSError as e:
+        logger.warning(f"Captions are not cached, failed to write {cache_file}: {e}")
+    finally:
+        if temporary_file is not None:
+            with suppress(OSError):
+                os.remove(temporary_file)
+
+
+def extract_pages(file_path):
+    """Yield page number, height, captions and their top coordinates of every page with captions"""
+    # stream the xml so pages can be processed while pdftohtml is still running
+    pdftohtml = subprocess.Popen(["pdftohtml", "-xml", "-stdout", "-i", file_path],
+                                 stdout=subprocess.PIPE, bufsize=1024*1024)
+    try:
+        for _, page in etree.iterparse(pdftohtml.stdout, events=("end",), tag="page"):
+            captions, top_coordinates = extract_captions(page)
+            if captions:
+                yield page.get("number"), int(page.get("height")), captions, top_coordinates
+
+            # free pages that have already been processed
+            page.clear()
+            while page.getprevious() is not None:
+                del page.getparent()[0]
+    finally:
+        pdftohtml.stdout.close()
+        pdftohtml.wait()
+
+    if pdftohtml.returncode:
+        raise subprocess.CalledProcessError(pdftohtml.returncode, pdftohtml.args)
+
+
+def file_digest(file_path):
+    """Hash the content of the file, used as key in the cache"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as file:
+        while chunk := file.read(1024*1024):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
 def check_figure_number(captions, current_figure, ignores, targets):
     """Check that no captions are missing and skip irrelevant figures"""
-    regex = re.compile(r"Figure (?P<number>\d+): .+")
     captions_to_skip = []
     for i, caption in enumerate(captions):
-        if match := regex.match(caption):
+        if match := figure_number.match(caption):
             if int(match.group("number")) == current_figure + 1:
                 current_figure += 1
             elif int(match.group("number")) != current_figure:
@@ -72,10 +166,10 @@ def get_ignore(ignore_path):
     if ignore_path:
         try:
             with open(ignore_path) as file:
-                return [int(line) for line in file.readlines()]
+                return {int(line) for line in file if line.strip()}
         except FileNotFoundError as e:
             logger.error("Ignore file not found: ", e)
-    return []
+    return set()
 
 
 def get_target(target_path):
@@ -83,85 +177,50 @@ def get_target(target_path):
     if target_path:
         try:
             with open(target_path) as file:
-                return [int(line) for line in file.readlines()]
+                return {int(line) for line in file if line.strip()}
         except FileNotFoundError as e:
             logger.error("Target file not found: ", e)
-    return []
+    return set()
 
 
 def extract_captions(page):
-    """Extract captions from page"""
-    elements = page.findall(".//text[b]")
-    return list(sort_by_top(
-                    remove_non_figure_text(
-                        concat_dashed_elements(
-                            remove_empty_elements(
-                                flatten_bold_elements(elements))))))
-
-
-def flatten_bold_elements(elements):
-    """Make parent include text from a bold child"""
-    for element in elements:
-        child = element.find(".//b")
-        element.text = child.text
-        yield element
-
-
-def remove_empty_elements(elements):
-    """Remove any elements with no text"""
-    for element in elements:
-        if element.text.strip():
-            yield element
-
-
-def concat_dashed_elements(elements):
-    """Remove false linebreaks caused by a dash"""
-    skip = False
-    for first, second in utils.pairwise(chain(elements, [None])):
-        if skip:
-            skip = False
-        elif second is None:
-            yield first
-        elif is_same_line(first, second):
-            first.text += second.text
-            skip = True
-            yield first
+    """Extract the text and top coordinate of captions on page, sorted by top coordinate"""
+    texts = []
+    tops = []
+    previous_top = previous_right = 0
+    # an element can only be merged with the previous one if that wasn't merged itself
+    mergeable = False
+    for element in text_with_bold(page):
+        # make parent include text from a bold child and remove any elements with no text
+        text = bold_child(element)[0].text
+        if not text or not text.strip():
+            continue
+
+        attrib = element.attrib
+        top = int(attrib["top"])
+        left = int(attrib["left"])
+        # remove false linebreaks caused by a dash
+        if mergeable and is_same_line(previous_top, previous_right, top, left):
+            texts[-1] += text
+            mergeable = False
         else:
-            yield first
+            texts.append(text)
+            tops.append(top)
+            previous_top = top
+            previous_right = left + int(attrib["width"])
+            mergeable = True
 
+    # remove any elements that doesn't include 'Figure' and sort by top coordinate
+    order = sorted((i for i, text in enumerate(texts) if text.startswith("Figure")),
+                   key=tops.__getitem__)
+    return [texts[i].strip() for i in order], [tops[i] for i in order]
 
-def is_same_line(first, second):
+
+def is_same_line(first_top, first_right, second_top, second_left):
     """Check if 2 elements is on the same line"""
-    first_right = int(first.get("left")) + int(first.get("width"))
-    first_top = int(first.get("top"))
-    second_left = int(second.get("left"))
-    second_top = int(second.get("top"))
     return 0 <= abs(first_top - second_top) <= 3 and 0 <= second_left - first_right <= 3
 
 
-def remove_non_figure_text(elements):
-    """Remove any elements that doesn't include 'Figure'"""
-    for element in elements:
-        if element.text.startswith("Figure"):
-            yield element
-
-
-def get_top(element):
-    """Get top coordinate from element"""
-    return int(element.get("top"))
-
-
-def sort_by_top(elements):
-    """Sort elements by their top coordinate"""
-    return sorted(elements, key=get_top)
-
-
-def get_text(elements):
-    """Yield only the text of each element and remove whitespace at the end"""
-    for element in elements:
-        yield element.text.strip()
-
-
 def main(file_path, ignore_path, target_path):
     """Entry point"""
     try:
@@ -10,35 +10,41 @@ from . import utils
 import camelot
 
 
-def extract_tables(file_path, page_height, page_number, content):
-    """Extract the tables on given page"""
-    tables_on_page = camelot.read_pdf(file_path, page_number, line_scale=35)
+def extract_tables(file_path, page_numbers):
+    """Extract the tables on all given pages with a single Camelot call and group them by page"""
+    tables_on_pages = {page_number: [] for page_number in page_numbers}
+    for table in camelot.read_pdf(file_path, ",".join(page_numbers), line_scale=35):
+        tables_on_pages[str(table.page)].append(table)
+    return tables_on_pages
+
+
+def match_page(tables_on_page, page_height, content):
+    """Match the tables on a page to their captions"""
     tables = {}
     for caption, table in match_caption_to_table(tables_on_page, page_height, content):
         if caption != "skip":
             tables.update({caption: table})
-    return page_number, tables
+    return tables
 
 
 def match_caption_to_table(tables, page_height, content):
+    """Match each table to the caption closest to it"""
+    caption_ys = [1 - caption_y / content["height"] for caption_y in content["top_coordinates"]]
     for table in tables:
         table_y = table.cells[0][0].lt[1]/page_height
-        caption_differences = [calc_difference(caption_y, table_y, content["height"])
-                               for caption_y in content["top_coordinates"]]
-        minimum_index = caption_differences.index(min(caption_differences))
+        minimum_index = min(range(len(caption_ys)), key=lambda i: abs(caption_ys[i] - table_y))
         yield content["captions"][minimum_index], table
 
 
-def calc_difference(caption_y, table_y, content_height):
-    return abs((1 - caption_y / content_height) - table_y)
-
-
-def main(file_path, page_height, page_number, content):
+def main(file_path, page_height, pages):
     """Entry point"""
     global logger
-    logger = utils.get_logger(f"Extractor.Page {page_number}")
+    page_numbers = list(pages)
+    logger = utils.get_logger(f"Extractor.Pages {page_numbers[0]}-{page_numbers[-1]}")
     try:
-        return extract_tables(file_path, page_height, page_number, content)
+        tables_on_pages = extract_tables(file_path, page_numbers)
     except FileNotFoundError as e:
         logger.critical(e)
-        return page_number, {}
+        return {}
+    return {page_number: match_page(tables_on_pages[page_number], page_height, content)
+            for page_number, content in pages.items()}
@@ -9,6 +9,16 @@ Parse content of NVMe specification table
 import re
 from . import utils
 
+# Regex to find name, brief and verbose descriptions of fields
+name_brief_verbose_regex = re.compile(
+    r"(?P<brief>.+?)\((?P<name>.+?)\):(?P<verbose>.+)"
+)
+brief_verbose_regex = re.compile(r"(?P<brief>.+?):(?P<verbose>.+)")
+
+# Regex to find malformed bits and bytes
+value_range = re.compile(r"\d+ to \d+")
+hexadecimal_value = re.compile(r"\d+h")
+
 
 def parse_page(page_number, tables):
     """Read tables, remove first row of each and concatenate"""
@@ -22,50 +32,55 @@ def parse_page(page_number, tables):
 
 def parse_table(caption, table):
     """Parse headings, remove notes and headings from table"""
-    table = table.df
-    headings = parse_headings(table.head(1).to_numpy()[0])
+    rows = table.data
+    headings = parse_headings(rows[0])
     # Check if the first word in the first row from the bottom is NOTES
-    first_word_of_last_row = table.tail(1).to_numpy()[0][0].split(":")[0]
+    first_word_of_last_row = rows[-1][0].split(":")[0]
     if "NOTE" in first_word_of_last_row or "Note" in first_word_of_last_row:
         if first_word_of_last_row != "NOTES":
             logger.warning(f"'{first_word_of_last_row}' should be 'NOTES'")
-        table = table.iloc[:-1, :]
-    if content := parse_content(headings, table.drop(0).reset_index(drop=True)):
+        rows = rows[1:-1]
+    else:
+        rows = rows[1:]
+    if content := parse_content(headings, rows):
         return {caption: content}
     else:
         return {}
 
 
 def parse_headings(row):
-    """Parse headings from row of table given as a dataframe"""
-    headings = [h.lower().replace("\n", "")
-                for h in row if h not in [None, ""]]
+    """Parse headings from row of table given as a list"""
+    headings = []
+    for heading in row:
+        if heading in (None, ""):
+            continue
 
-    # rename bit to bits - ideally this should never happen
-    for i, heading in enumerate(headings):
+        heading = heading.lower().replace("\n", "")
+        # rename bit to bits and byte to bytes - ideally this should never happen
         if heading == "bit":
-            headings[i] = "bits"
             logger.warning(f"'{heading}' instead of 'bits'")
-
-    # rename byte to bytes - ideally this should never happen
-    for i, heading in enumerate(headings):
-        if heading == "byte":
-            headings[i] = "bytes"
+            heading = "bits"
+        elif heading == "byte":
             logger.warning(f"'{heading}' instead of 'bytes'")
+            heading = "bytes"
+        headings.append(heading)
 
     return headings
 
 
-def parse_content(headings, table):
-    """Parse content from table"""
+def parse_content(headings, rows):
+    """Parse content from rows of table"""
     output = []
     subheadings = None
-    for row in table.itertuples(index=False, name=None):
-        if all(value == "" for value in row):
+    # rows of a table have the same length, so the empty rows can be built once
+    empty_row = [""] * len(rows[0]) if rows else []
+    empty_headings = [""] * len(headings)
+    for row in rows:
+        if row == empty_row:
             # skip empty rows
             continue
 
-        elif all(value == "" for value in row[:len(headings)]):
+        elif row[:len(headings)] == empty_headings:
             # Parse nested tables
             if subheadings is None:
                 subheadings = parse_headings(row)
@@ -88,18 +103,12 @@ def parse_content(headings, table):
 
 
 def parse_row(row, headings, start_index):
-    """Parse content from row given as a tuple"""
+    """Parse content from row given as a list"""
     content = {"children": []}
 
-    name_brief_verbose_regex = re.compile(
-        r"(?P<brief>.+?)\((?P<name>.+?)\):(?P<verbose>.+)"
-    )
-    brief_verbose_regex = re.compile(r"(?P<brief>.+?):(?P<verbose>.+)")
-    value_range = re.compile(r"\d+ to \d+")
-    hexadecimal_value = re.compile(r"\d+h")
-
     for i, heading in enumerate(headings):
         current_position = row[start_index + i]
+        without_linebreaks = current_position.replace("\n", "")
         if heading in ["bits", "bytes"]:
             try:
                 bs = [int(b) for b in current_position.split(":")]
@@ -121,14 +130,12 @@ def parse_row(row, headings, start_index):
                     logger.debug(e)
                     content[heading] = current_position.split(":")
 
-        elif match := name_brief_verbose_regex.match(
-                current_position.replace("\n", "")):
+        elif match := name_brief_verbose_regex.match(without_linebreaks):
             content["name"] = match.group("name").strip().lower()
             content["brief"] = match.group("brief").strip()
             content["verbose"] = match.group("verbose").strip()
 
-        elif match := brief_verbose_regex.match(
-                current_position.replace("\n", "")):
+        elif match := brief_verbose_regex.match(without_linebreaks):
             content["brief"] = match.group("brief").strip()
             content["verbose"] = match.group("verbose").strip()
 
@@ -6,7 +6,10 @@ SPDX-License-Identifier: GPLv2-or-later or Apache-2.0
 Schedule multiple instances of the parser and collect results
 """
 import concurrent.futures
-from itertools import repeat
+from itertools import chain, islice
+import math
+import multiprocessing
+import os
 import traceback
 
 from . import captions
@@ -18,31 +21,81 @@ from . import utils
 import camelot
 import yaml
 
+# Use the dumper from libyaml if PyYAML was built with it.
+# Both dumpers write the same data, but libyaml folds long double-quoted strings differently,
+# so output.yaml isn't byte-for-byte identical between the two
+try:
+    from yaml import CSafeDumper as Dumper
+except ImportError:
+    from yaml import SafeDumper as Dumper
+
 logger = utils.get_logger("Scheduler")
 
+# Maximum number of pages each process extracts with a single Camelot call
+pages_per_batch = 4
+
 
 def schedule(file_path, ignore_path, target_path):
-    """Assign each page to a different process and collect results in dict"""
+    """Assign batches of pages to different processes and collect results in dict"""
     page_height = get_page_height(file_path)
-    with concurrent.futures.ProcessPoolExecutor(10) as executor:
+    workers = os.cpu_count() or 4
+    # batches are submitted as soon as they're found, so extraction starts while pdftohtml is running
+    batches = split_pages(captions.main(file_path, ignore_path, target_path), workers)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                mp_context=get_mp_context(),
+                                                initializer=init_worker,
+                                                initargs=(file_path, page_height, utils.log_level)) as executor:
+        futures = [executor.submit(parse, batch) for batch in batches]
         pages = {}
-        for page in executor.map(parse, list(captions.main(file_path, ignore_path, target_path)), repeat(file_path), repeat(page_height)):
-            pages.update(page)
-        return pages
-
-
-def parse(page_number_to_content, file_path, page_height):
-    """Pass args to the parser"""
-    page_number, tables = extractor.main(file_path, page_height, *page_number_to_content)
-    if tables:
-        try:
-            return parser.main(page_number, tables)
-        except Exception as e:
-            logger.debug(traceback.format_exc())
-            logger.error(f"Error on page {page_number}: {type(e).__name__} {e}")
-            return {}
-    else:
-        return {}
+        for future in concurrent.futures.as_completed(futures):
+            pages.update(future.result())
+    # batches complete in any order, but tables spanning multiple pages are concatenated in page order
+    return dict(sorted(pages.items(), key=lambda page: int(page[0])))
+
+
+def split_pages(pages, workers):
+    """Split pages into batches of consecutive pages.
+    Batches are smaller if there are too few pages to give every worker a full batch"""
+    pages = iter(pages)
+    # the batch size is decided once there are enough pages for a full batch per worker or no more pages
+    first_pages = list(islice(pages, workers * pages_per_batch))
+    size = max(1, math.ceil(len(first_pages) / workers))
+    pages = chain(first_pages, pages)
+    while batch := dict(islice(pages, size)):
+        yield batch
+
+
+def get_mp_context():
+    """Start workers from a fork server with Camelot already imported, if the platform supports it.
+    This avoids forking the scheduler while it is streaming from pdftohtml"""
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return None
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def init_worker(file_path, page_height, log_level):
+    """Set the arguments shared by every batch once per process instead of sending them with each batch"""
+    global worker_file_path, worker_page_height
+    # workers started from the fork server don't inherit the log level set on the command line
+    utils.log_level = log_level
+    logger.setLevel(log_level)
+    worker_file_path = file_path
+    worker_page_height = page_height
+
+
+def parse(pages):
+    """Pass args to the parser. Only plain dicts are returned, no Camelot tables leave the worker"""
+    parsed = {}
+    for page_number, tables in extractor.main(worker_file_path, worker_page_height, pages).items():
+        if tables:
+            try:
+                parsed.update(parser.main(page_number, tables))
+            except Exception as e:
+                logger.debug(traceback.format_exc())
+                logger.error(f"Error on page {page_number}: {type(e).__name__} {e}")
+    return parsed
 
 
 def get_page_height(file_path):
@@ -54,7 +107,7 @@ def get_page_height(file_path):
 def write_to_yaml(output):
     """Write content to yaml"""
     with open("output.yaml", "w") as file:
-        yaml.dump(output, file, default_flow_style=None)
+        yaml.dump(output, file, Dumper=Dumper, default_flow_style=None)
 
 
 def transform(pages):
@@ -5,7 +5,8 @@ SPDX-License-Identifier: GPLv2-or-later or Apache-2.0
 
 Transform and clean up tables
 """
-import math
+from itertools import islice
+import logging
 import re
 import traceback
 from . import utils
@@ -14,7 +15,14 @@ logger = utils.get_logger("Transformer")
 
 # Regex to find hexadecimal numbers and ranges
 hex_value = re.compile(r"^[0-9A-F]+h$")
-hex_range = re.compile(r"^[0-9A-F]+h to [0-9A-F]+h$")
+hex_value_or_range = re.compile(r"^[0-9A-F]+h( to [0-9A-F]+h)?$")
+
+# Regex to split table titles into number, group and title or number and title
+number_group_title = re.compile(r"Figure (\d+): (.+) \u2013 (.+)")
+number_title = re.compile(r"Figure (\d+): (.+)")
+
+# Regex to find command dword numbers in table titles
+dword_number = re.compile(r"dword (\d+)")
 
 
 class Table(list):
@@ -28,6 +36,10 @@ class Table(list):
         self.spec_type = ""
         self.c_type = ""
         self.headings = self.create_headings()
+        # cache lookups in the headings used by several transformations
+        self.has_bits = "bits" in self.headings
+        self.has_bytes = "bytes" in self.headings
+        self.hex_headings = [heading for heading in self.headings if "hex-" in heading]
 
     def create_headings(self):
         """Create headings from first row.
@@ -40,50 +52,52 @@ class Table(list):
     def remove_empty_children(self):
         """Remove key 'children' if the list is empty"""
         for row in self.rows:
-            if not row["children"]:
-                del row["children"]
+            if not row.get("children"):
+                row.pop("children", None)
 
         # Remove heading if no children are present in the entire table
-        if all("children" not in row.keys() for row in self.rows):
+        if all("children" not in row for row in self.rows):
             self.headings.remove("children")
 
     def enforce_headings(self):
         """Remove rows that do not align with the headings,
         e.g. if 'bits' are in the headings, remove rows that do not have 'bits'"""
-        if "bits" in self.headings:
+        if self.has_bits:
             self.rows = [row for row in self.rows if row.get("bits")]
-        elif "bytes" in self.headings:
+        elif self.has_bytes:
             self.rows = [row for row in self.rows if row.get("bytes")]
 
     def generate_name(self):
         """Generate a value for the 'name' key if it doesn't exist"""
         for row in self.rows:
-            if "name" not in row:
-                if row.get("description") == "Reserved":
-                    row["name"] = "rsvd"
-                elif "brief" in row:
-                    if "bits" or "bytes" in row:
-                        logger.debug(f"{self.title}: field {row['brief']} is missing name")
-                    row["name"] = row["brief"].lower().replace(" ", "_")
-                else:
-                    name = row["definition"] if "definition" in row else row.get("description", "skip")
-                    row["name"] = name.lower().replace(" ", "_")
+            if "name" in row:
+                continue
+
+            if row.get("description") == "Reserved":
+                row["name"] = "rsvd"
+            elif "brief" in row:
+                if "bits" in row or "bytes" in row:
+                    logger.debug("%s: field %s is missing name", self.title, row["brief"])
+                row["name"] = row["brief"].lower().replace(" ", "_")
+            else:
+                name = row["definition"] if "definition" in row else row.get("description", "skip")
+                row["name"] = name.lower().replace(" ", "_")
 
     def process_title(self):
         """Convert the title to number, group and title or number and title"""
-        number_group_title = re.compile(r"Figure (?P<number>\d+): (?P<group>.+) \u2013 (?P<title>.+)")
-        number_title = re.compile(r"Figure (?P<number>\d+): (?P<title>.+)")
         if match := number_group_title.match(self.title):
-            self.number = int(match.group("number"))
-            self.group = match.group("group").lower().replace(" ", "_")
-            self.title = match.group("title").lower()
+            number, group, title = match.groups()
+            self.number = int(number)
+            self.group = group.lower().replace(" ", "_")
+            self.title = title.lower()
         elif match := number_title.match(self.title):
-            self.number = int(match.group("number"))
-            self.title = match.group("title").lower()
+            number, title = match.groups()
+            self.number = int(number)
+            self.title = title.lower()
 
     def determine_c_type(self):
         """Determine whether group is an enum or struct"""
-        if [heading for heading in self.headings if "hex-" in heading]:
+        if self.hex_headings:
             self.c_type = "enum"
         else:
             self.c_type = "struct"
@@ -98,15 +112,14 @@ class Table(list):
     def clean_bits_and_bytes(self):
         """Clean up bytes and bits and remove rows without an integer value"""
         heading = ""
-        if "bits" in self.headings:
+        if self.has_bits:
             heading = "bits"
-        elif "bytes" in self.headings:
+        elif self.has_bytes:
             heading = "bytes"
 
         if heading:
             self.check_order()
-            self.check_for_holes(heading)
-            self.check_overlap(heading)
+            self.check_ranges(heading)
             self.calculate_bits_and_bytes(heading)
             self.check_sum(heading)
             self.rows = [row for row in self.rows
@@ -115,94 +128,102 @@ class Table(list):
     def calculate_bits_and_bytes(self, heading):
         """Convert the bits and bytes to a single number instead of a range"""
         for row in self.rows:
-            if not all(isinstance(value, int) for value in row[heading]):
-                logger.debug(f"{self.title} contains non integer values in {heading} column")
-            elif len(row[heading]) == 1:
+            value = row[heading]
+            # values are either [value] or [high, low]
+            if len(value) == 1 and isinstance(value[0], int):
                 row[heading] = 1
+            elif len(value) == 2 and isinstance(value[0], int) and isinstance(value[1], int):
+                row[heading] = value[0] - value[1] + 1
+            elif all(isinstance(part, int) for part in value):
+                # left as is, rows without an integer value are removed afterwards
+                logger.debug("%s: unexpected %s value %s", self.title, heading, value)
             else:
-                row[heading] = row[heading][0] - row[heading][1] + 1
+                logger.debug("%s contains non integer values in %s column", self.title, heading)
 
     def check_order(self):
         """Check that bits go from high to low and hex values and bytes from low to high"""
-        if "bits" in self.headings and len(self.rows) > 1 and sorted(self.rows, key=lambda row: row["bits"][0], reverse=True) != self.rows:
-            logger.warning(f"{self.title}: bits are in wrong order")
-            self.rows = sorted(self.rows, key=lambda row: row["bits"][0], reverse=True)
-
-        elif "bytes" in self.headings and len(self.rows) > 1 and sorted(self.rows, key=lambda row: row["bytes"][0]) != self.rows:
-            logger.warning(f"{self.title}: bytes are in wrong order")
-            self.rows = sorted(self.rows, key=lambda row: row["bytes"][0])
+        if self.has_bits and len(self.rows) > 1:
+            # only sort if the rows aren't already in order
+            keys = [row["bits"][0] for row in self.rows]
+            if any(first < second for first, second in utils.pairwise(keys)):
+                logger.warning("%s: bits are in wrong order", self.title)
+                self.rows = sorted(self.rows, key=lambda row: row["bits"][0], reverse=True)
+
+        elif self.has_bytes and len(self.rows) > 1:
+            keys = [row["bytes"][0] for row in self.rows]
+            if any(first > second for first, second in utils.pairwise(keys)):
+                logger.warning("%s: bytes are in wrong order", self.title)
+                self.rows = sorted(self.rows, key=lambda row: row["bytes"][0])
 
     def check_sum(self, heading):
         """Check that the sum of bits and bytes is a power of 2"""
-        row_sum = sum(row[heading] for row in self.rows)
-        if not math.log(row_sum, 2).is_integer():
-            logger.warning(f"{self.title}: sum of {heading} is not a power of 2")
-
-    def check_overlap(self, heading):
-        """Check that no bit or byte is present twice"""
-        sequence = []
-        for row in self.rows:
-            if len(row[heading]) == 1:
-                sequence.append(row[heading][0])
-            else:
-                sequence.extend(range(row[heading][1], row[heading][0]+1))
-        if len(sequence) != len(set(sequence)):
-            logger.warning(f"{self.title}: overlap of {heading}")
-
-    def check_for_holes(self, heading):
-        """Check that there are no holes in the bits and bytes"""
-        sequence = []
-        for row in self.rows:
-            if len(row[heading]) == 1:
-                sequence.append(row[heading][0])
-            else:
-                sequence.extend(range(row[heading][1], row[heading][0]+1))
-        sequence.sort()
-        if any(abs(j - i) > 1 for i, j in zip(sequence[:-1], sequence[1:])):
-            logger.warning(f"{self.title}: hole in {heading}")
+        # values that couldn't be calculated are removed afterwards and don't count
+        row_sum = sum(row[heading] for row in self.rows if isinstance(row[heading], int))
+        # a power of 2 has exactly one bit set
+        if row_sum <= 0 or row_sum & (row_sum - 1):
+            logger.warning("%s: sum of %s is not a power of 2", self.title, heading)
+
+    def check_ranges(self, heading):
+        """Check that there are no holes in the bits and bytes and that no bit or byte is present twice"""
+        # bits and bytes are stored as [high, low] or [value],
+        # ranges in the wrong order cover no bits or bytes and are skipped
+        ranges = sorted((row[heading][-1], row[heading][0]) for row in self.rows
+                        if row[heading][-1] <= row[heading][0])
+        hole = overlap = False
+        if ranges:
+            covered = ranges[0][1]
+            for low, high in islice(ranges, 1, None):
+                if low <= covered:
+                    overlap = True
+                elif low > covered + 1:
+                    hole = True
+                if high > covered:
+                    covered = high
+                if hole and overlap:
+                    break
+
+        if hole:
+            logger.warning("%s: hole in %s", self.title, heading)
+        if overlap:
+            logger.warning("%s: overlap of %s", self.title, heading)
 
     def reverse_bits_rows(self):
         """Reverse the order of rows if the table contains bits"""
-        if "bits" in self.headings:
-            self.rows = list(reversed(self.rows))
+        if self.has_bits:
+            self.rows.reverse()
 
     def clean_hex(self):
         """Clean up hex values and remove non hex values from hex columns"""
         self.detect_hex_columns()
-        for heading in [heading for heading in self.headings if "hex-" in heading]:
-            self.rows = [row for row in self.rows
-                         if hex_value.match(row[heading])
-                         or hex_range.match(row[heading])]
-            self.remove_hex_ranges(heading)
-            self.change_hex_format(heading)
+        for heading in self.hex_headings:
+            # keep only single hex values, non hex values and hex ranges are removed,
+            # and change hex format from {n}h to 0x{n}
+            rows = []
+            for row in self.rows:
+                # rows without the column are removed as well
+                value = row.get(heading)
+                if isinstance(value, str) and hex_value.match(value):
+                    row[heading] = "0x" + value[:-1]
+                    rows.append(row)
+            self.rows = rows
 
     def detect_hex_columns(self):
         """Change headings of columns with hex values to 'hex'"""
-        headings_to_change = set()
-        for row in self.rows:
-            for i, heading in enumerate(self.headings):
-                try:
-                    if hex_value.match(row.get(heading)) or hex_range.match(row.get(heading)):
-                        headings_to_change.add(i)
-                except TypeError:
-                    continue
-
-        for index in headings_to_change:
-            old_heading = self.headings[index]
+        renamed_headings = {}
+        for heading in self.headings:
+            # a single hex value or range is enough to detect the column
             for row in self.rows:
-                row[f"hex-{old_heading}"] = row[old_heading]
-                del row[old_heading]
+                value = row.get(heading)
+                if isinstance(value, str) and hex_value_or_range.match(value):
+                    renamed_headings[heading] = f"hex-{heading}"
+                    break
 
-            self.headings[index] = f"hex-{old_heading}"
+        if renamed_headings:
+            self.rows = [{renamed_headings.get(key, key): value for key, value in row.items()}
+                         for row in self.rows]
+            self.headings = [renamed_headings.get(heading, heading) for heading in self.headings]
 
-    def remove_hex_ranges(self, heading):
-        """Remove hex ranges as they're"""
-        self.rows = [row for row in self.rows if not hex_range.match(row[heading])]
-
-    def change_hex_format(self, heading):
-        """Change hex format from {n}h to 0x{n}"""
-        for row in self.rows:
-            row[heading] = "0x" + row[heading].strip("h")
+        self.hex_headings = [heading for heading in self.headings if "hex-" in heading]
 
     def process_children(self):
         """Apply relevant functions to child table"""
@@ -212,43 +233,42 @@ class Table(list):
                 child_title = f"Figure {self.number}:children"
 
                 table = Table(child_title, row["children"])
-                method_names = ["remove_empty_children",
-                                "enforce_headings",
-                                "clean_bits_and_bytes",
-                                "clean_hex",
-                                "reverse_bits_rows"]
-
-                for name in method_names:
+                for method in child_transformations:
                     try:
-                        getattr(table, name)()
+                        method(table)
                     except Exception as e:
-                        logger.debug(traceback.format_exc())
-                        logger.debug(f"{child_title} Method {name} failed: {type(e).__name__} {e}")
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug(traceback.format_exc())
+                        logger.debug("%s Method %s failed: %s %s", child_title, method.__name__, type(e).__name__, e)
                 row["children"] = table.rows
 
 
+# Transformations applied to child tables and tables, in order
+child_transformations = (Table.remove_empty_children,
+                         Table.enforce_headings,
+                         Table.clean_bits_and_bytes,
+                         Table.clean_hex,
+                         Table.reverse_bits_rows)
+
+table_transformations = child_transformations + (Table.generate_name,
+                                                 Table.process_title,
+                                                 Table.determine_spec_type,
+                                                 Table.determine_c_type,
+                                                 Table.process_children)
+
+
 def transform(tables):
     """Apply tranformations to tables"""
     groups = {}
     for title, rows in tables.items():
         table = Table(title, rows)
-        method_names = ["remove_empty_children",
-                        "enforce_headings",
-                        "clean_bits_and_bytes",
-                        "clean_hex",
-                        "reverse_bits_rows",
-                        "generate_name",
-                        "process_title",
-                        "determine_spec_type",
-                        "determine_c_type",
-                        "process_children"]
-
-        for name in method_names:
+        for method in table_transformations:
             try:
-                getattr(table, name)()
+                method(table)
             except Exception as e:
-                logger.debug(traceback.format_exc())
-                logger.debug(f"{title}: Method {name} failed: {type(e).__name__} {e}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(traceback.format_exc())
+                logger.debug("%s: Method %s failed: %s %s", title, method.__name__, type(e).__name__, e)
 
         transformed_table = {"title": table.title,
                              "number": table.number,
@@ -270,10 +290,7 @@ def flatten_pages(pages):
     tables = {}
     for table in pages.values():
         for k, v in table.items():
-            if k in tables:
-                tables[k] += v
-            else:
-                tables[k] = v
+            tables.setdefault(k, []).extend(v)
     return tables
 
 
@@ -281,25 +298,27 @@ def collect_types(groups):
     """Collect types of the group and add them"""
     transformed = {}
     for group_name, tables in groups.items():
-        c_type = ""
         spec_type = ""
+        all_enums = True
+        all_structs = True
+        for table in tables:
+            # Collect spec type
+            if "command dword" in table["title"]:
+                spec_type = "command"
+
+            # Collect c type
+            c_type = table.pop("c_type")
+            all_enums = all_enums and c_type == "enum"
+            all_structs = all_structs and c_type == "struct"
+            del table["spec_type"]
 
-        # Collect spec type
-        if any("command dword" in table["title"] for table in tables):
-            spec_type = "command"
-
-        # Collect c type
-        if all(table["c_type"] == "enum" for table in tables):
+        if all_enums:
             c_type = "enum"
-        elif all(table["c_type"] == "struct" for table in tables):
+        elif all_structs:
             c_type = "struct"
         else:
             c_type = "skip"
-            logger.debug(f"{group_name} is a mix of enums and structs and will be skipped")
-
-        for table in tables:
-            del table["c_type"]
-            del table["spec_type"]
+            logger.debug("%s is a mix of enums and structs and will be skipped", group_name)
 
         transformed.update({group_name: {"tables": tables,
                                          "spec_type": spec_type,
@@ -312,26 +331,26 @@ def process_commands(groups):
     """Check for missing commands and make sure bits are correct"""
     for group_name, content in groups.items():
         if content["spec_type"] == "command":
-            regex = re.compile(r"dword (?P<number>\d+)")
             commands = gen_empty_commands()
 
             for table in content["tables"]:
-                matches = re.findall(regex, table["title"])
-                if len(matches) == 2:
+                # a third match is only needed to tell that there are more than 2
+                dwords = [int(match.group(1)) for match in islice(dword_number.finditer(table["title"]), 3)]
+                if len(dwords) == 2:
                     if 64 == sum(row["bits"] for row in table["rows"]):
                         table.update({"type": 64})
-                        commands[int(matches[0])] = table
+                        commands[dwords[0]] = table
                         # If 2 commands present in 1 table
                         # Skip the table at the index of the second command
-                        commands[int(matches[1])]["title"] = "skip"
+                        commands[dwords[1]]["title"] = "skip"
                     else:
-                        logger.warning(f"Figure {table['number']}: {table['title']} bits doesn't sum up to 64")
-                elif len(matches) == 1:
+                        logger.warning("Figure %s: %s bits doesn't sum up to 64", table["number"], table["title"])
+                elif len(dwords) == 1:
                     if 32 == sum(row["bits"] for row in table["rows"]):
                         table.update({"type": 32})
-                        commands[int(matches[0])] = table
+                        commands[dwords[0]] = table
                     else:
-                        logger.warning(f"Figure {table['number']}: {table['title']} bits doesn't sum up to 32")
+                        logger.warning("Figure %s: %s bits doesn't sum up to 32", table["number"], table["title"])
             content["tables"] = commands
 
 
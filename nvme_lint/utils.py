@@ -5,6 +5,7 @@ SPDX-License-Identifier: GPLv2-or-later or Apache-2.0
 
 Utilities for nvme-lint
 """
+from functools import lru_cache
 import logging
 from pathlib import Path
 from itertools import tee
@@ -24,6 +25,10 @@ def get_logger(name):
     logger = logging.getLogger(name)
     logger.setLevel(level=log_level)
 
+    # handlers are only added the first time, otherwise every message would be written once per call
+    if logger.handlers:
+        return logger
+
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
     logger.addHandler(stream_handler)
@@ -34,6 +39,7 @@ def get_logger(name):
     return logger
 
 
+@lru_cache(maxsize=1)
 def log_path():
     if "XDG_DATA_HOME" in os.environ:
         target = expand_path("$XDG_DATA_HOME")
@@ -47,6 +53,19 @@ def log_path():
     return log_directory / "nvme-lint.log"
 
 
+def cache_path():
+    if "XDG_CACHE_HOME" in os.environ:
+        target = expand_path("$XDG_CACHE_HOME")
+    else:
+        target = expand_path("~/.cache")
+
+    cache_directory = Path(target) / "nvme-lint"
+    if not cache_directory.exists():
+        cache_directory.mkdir(parents=True)
+
+    return cache_directory
+
+
 def config_log_level(user_level):
     """Configure the logging level based on user input"""
     global log_level
@@ -57,9 +76,13 @@ def config_log_level(user_level):
         log_level = level
 
 
-# from https://docs.python.org/3.8/library/itertools.html
-def pairwise(iterable):
-    "s -> (s0,s1), (s1,s2), (s2, s3), ..."
-    a, b = tee(iterable)
-    next(b, None)
-    return zip(a, b)
+try:
+    # implemented in C since Python 3.10
+    from itertools import pairwise
+except ImportError:
+    # from https://docs.python.org/3.8/library/itertools.html
+    def pairwise(iterable):
+        "s -> (s0,s1), (s1,s2), (s2, s3), ..."
+        a, b = tee(iterable)
+        next(b, None)
+        return zip(a, b)
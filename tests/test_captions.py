@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2022 Samsung Electronics Co., Ltd
+SPDX-License-Identifier: GPLv2-or-later or Apache-2.0
+"""
+import errno
+import io
+import pytest
+from lxml import etree
+from nvme_lint import captions
+
+
+page = etree.fromstring("""
+<page number="1" position="absolute" top="0" left="0" height="1188" width="918">
+    <text top="400" left="100" width="50" height="12" font="1"><b>Figure 2: Later caption</b></text>
+    <text top="100" left="100" width="200" height="12" font="1"><b>Figure 1: Caption broken at a dash-</b></text>
+    <text top="101" left="302" width="40" height="12" font="1"><b>continued </b></text>
+    <text top="200" left="100" width="100" height="12" font="1"><b></b></text>
+    <text top="300" left="100" width="100" height="12" font="1"><b>Figure 3: First-</b></text>
+    <text top="300" left="200" width="50" height="12" font="1"><b>second</b></text>
+    <text top="300" left="250" width="50" height="12" font="1"><b>Figure 4: third</b></text>
+    <text top="500" left="100" width="100" height="12" font="1"><b>Table of contents</b></text>
+    <text top="600" left="100" width="100" height="12" font="1">Figure 5: Not bold</text>
+</page>
+""")
+
+
+def test_extract_captions():
+    texts, tops = captions.extract_captions(page)
+
+    # a dashed caption is merged, but an element is never merged into an already merged one
+    assert texts == ["Figure 1: Caption broken at a dash-continued",
+                     "Figure 3: First-second",
+                     "Figure 4: third",
+                     "Figure 2: Later caption"]
+    assert tops == [100, 300, 300, 400]
+
+
+def test_is_same_line():
+    assert captions.is_same_line(100, 300, 103, 303)
+    assert not captions.is_same_line(100, 300, 104, 300)
+    assert not captions.is_same_line(100, 300, 100, 304)
+    assert not captions.is_same_line(100, 300, 100, 299)
+
+
+# Output of pdftohtml containing the page above
+pdftohtml_output = b"<pdf2xml>" + etree.tostring(page) + b"</pdf2xml>"
+
+
+class FakePdftohtml:
+    """Stand-in for the pdftohtml process writing the given output and exiting with the given code"""
+
+    def __init__(self, exit_code, output=pdftohtml_output):
+        self.args = ["pdftohtml"]
+        self.stdout = io.BytesIO(output)
+        self.returncode = None
+        self.exit_code = exit_code
+
+    def wait(self):
+        self.returncode = self.exit_code
+        return self.returncode
+
+
+@pytest.fixture
+def pdf_file(tmp_path, monkeypatch):
+    """Create a pdf file and let pdftohtml output the page above for it"""
+    monkeypatch.setattr(captions.subprocess, "Popen", lambda *args, **kwargs: FakePdftohtml(0))
+    pdf_file = tmp_path / "specification.pdf"
+    pdf_file.write_bytes(b"%PDF-1.7")
+    return pdf_file
+
+
+def cached_files(tmp_path):
+    """List the files in the cache directory"""
+    return list((tmp_path / "cache" / "nvme-lint").iterdir())
+
+
+def test_read_pages_without_cache_directory(pdf_file, monkeypatch):
+    # the cache directory can't be created inside a regular file
+    monkeypatch.setenv("XDG_CACHE_HOME", str(pdf_file))
+    pages = list(captions.read_pages(pdf_file))
+
+    assert [page_number for page_number, _, _, _ in pages] == ["1"]
+
+
+def test_read_pages_with_failing_cache_write(pdf_file, tmp_path, monkeypatch):
+    def full_disk(*args):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(captions.pickle, "dump", full_disk)
+    pages = list(captions.read_pages(pdf_file))
+
+    assert [page_number for page_number, _, _, _ in pages] == ["1"]
+    # the temporary file is removed as well
+    assert not cached_files(tmp_path)
+
+
+def test_read_pages_caches_complete_extraction(pdf_file, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    pages = list(captions.read_pages(pdf_file))
+    assert len(cached_files(tmp_path)) == 1
+
+    # the second run reads the cache and doesn't start pdftohtml
+    monkeypatch.setattr(captions.subprocess, "Popen", None)
+    assert list(captions.read_pages(pdf_file)) == pages
+
+
+def test_read_pages_does_not_cache_failed_extraction(pdf_file, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(captions.subprocess, "Popen", lambda *args, **kwargs: FakePdftohtml(1))
+    pages = list(captions.read_pages(pdf_file))
+
+    # the pages that were extracted are still used
+    assert [page_number for page_number, _, _, _ in pages] == ["1"]
+    assert not cached_files(tmp_path)
+
+
+def test_read_pages_does_not_cache_partial_extraction(pdf_file, tmp_path, monkeypatch):
+    output = pdftohtml_output[:-len(b"</pdf2xml>")]
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(captions.subprocess, "Popen", lambda *args, **kwargs: FakePdftohtml(1, output))
+    with pytest.raises(etree.XMLSyntaxError):
+        list(captions.read_pages(pdf_file))
+
+    assert not cached_files(tmp_path)
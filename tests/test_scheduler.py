@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2022 Samsung Electronics Co., Ltd
+SPDX-License-Identifier: GPLv2-or-later or Apache-2.0
+"""
+import pytest
+from nvme_lint import scheduler
+
+
+@pytest.mark.parametrize("number_of_pages, workers, sizes", [(0, 8, []),
+                                                             (3, 8, [1, 1, 1]),
+                                                             (8, 8, [1] * 8),
+                                                             (12, 8, [2] * 6),
+                                                             (24, 8, [3] * 8),
+                                                             (40, 8, [4] * 10),
+                                                             (42, 4, [4] * 10 + [2])])
+def test_split_pages(number_of_pages, workers, sizes):
+    pages = [(str(page_number), {}) for page_number in range(1, number_of_pages + 1)]
+    batches = list(scheduler.split_pages(iter(pages), workers))
+
+    assert [len(batch) for batch in batches] == sizes
+    # every page ends up in a batch, in order
+    assert [page for batch in batches for page in batch.items()] == pages
@@ -3,184 +3,297 @@
 Copyright (c) 2022 Samsung Electronics Co., Ltd
 SPDX-License-Identifier: GPLv2-or-later or Apache-2.0
 """
-from copy import deepcopy
+import logging
 import pytest
 from nvme_lint import transformer
 
 
-bits_table = transformer.Table("test table", [
-        {"bits": [3,0]},
-        {"bits": [6,4]},
-        {"bits": [31,8]},
-        {"bits": [31,16]}
-    ])
+def new_table(rows):
+    """Create a table from a copy of the given bits or bytes rows and their values,
+    so tests don't share state"""
+    return transformer.Table("test table", [{key: list(value) for key, value in row.items()}
+                                            for row in rows])
 
-bytes_table = transformer.Table("test table", [
-        {"bytes": [31,16]},
-        {"bytes": [31,8]},
-        {"bytes": [6,4]},
-        {"bytes": [3,0]},
-    ])
 
+bits_rows = (
+    {"bits": [3,0]},
+    {"bits": [6,4]},
+    {"bits": [31,8]},
+    {"bits": [31,16]}
+)
 
-half_bits_table = transformer.Table("test table", [
-        {"bits": [14,11]},
-        {"bits": [10]},
-        {"bits": [9]},
-        {"bits": [8]},
-    ])
+bytes_rows = (
+    {"bytes": [31,16]},
+    {"bytes": [31,8]},
+    {"bytes": [6,4]},
+    {"bytes": [3,0]},
+)
 
-half_bytes_table = transformer.Table("test table", [
-        {"bytes": [8]},
-        {"bytes": [9]},
-        {"bytes": [10]},
-        {"bytes": [14,11]},
-    ])
 
-unordered_bits_table = transformer.Table("test table", [
-        {"bits": [15,8]},
-        {"bits": [31,16]},
-        {"bits": [7,4]},
-        {"bits": [3,0]},
-    ])
+half_bits_rows = (
+    {"bits": [14,11]},
+    {"bits": [10]},
+    {"bits": [9]},
+    {"bits": [8]},
+)
 
-unordered_bytes_table = transformer.Table("test table", [
-        {"bytes": [3,0]},
-        {"bytes": [15,8]},
-        {"bytes": [7,4]},
-        {"bytes": [31,16]},
-    ])
+half_bytes_rows = (
+    {"bytes": [8]},
+    {"bytes": [9]},
+    {"bytes": [10]},
+    {"bytes": [14,11]},
+)
 
-healthy_bits_table = transformer.Table("test table", [
-        {"bits": [31,16]},
-        {"bits": [15,8]},
-        {"bits": [7,4]},
-        {"bits": [3,0]},
-    ])
+unordered_bits_rows = (
+    {"bits": [15,8]},
+    {"bits": [31,16]},
+    {"bits": [7,4]},
+    {"bits": [3,0]},
+)
 
-healthy_bytes_table = transformer.Table("test table", [
-        {"bytes": [3,0]},
-        {"bytes": [7,4]},
-        {"bytes": [15,8]},
-        {"bytes": [31,16]},
-    ])
+unordered_bytes_rows = (
+    {"bytes": [3,0]},
+    {"bytes": [15,8]},
+    {"bytes": [7,4]},
+    {"bytes": [31,16]},
+)
 
+healthy_bits_rows = (
+    {"bits": [31,16]},
+    {"bits": [15,8]},
+    {"bits": [7,4]},
+    {"bits": [3,0]},
+)
 
-@pytest.mark.parametrize("table, result, type", [(deepcopy(bits_table), [4, 3, 24, 16], "bits"),
-                                                 (deepcopy(healthy_bits_table), [16, 8, 4, 4], "bits"),
-                                                 (deepcopy(half_bits_table), [4, 1, 1, 1], "bits"),
-                                                 (deepcopy(bytes_table), [16, 24, 3, 4], "bytes"),
-                                                 (deepcopy(healthy_bytes_table), [4, 4, 8, 16], "bytes"),
-                                                 (deepcopy(half_bytes_table), [1, 1, 1, 4], "bytes")])
-def test_calculate_bits(table, result, type, caplog):
-    table.calculate_bits_and_bytes(type)
-    assert table.rows[0][type] == result[0]
-    assert table.rows[1][type] == result[1]
-    assert table.rows[2][type] == result[2]
-    assert table.rows[3][type] == result[3]
-
-
-@pytest.mark.parametrize("table, result", [(deepcopy(bits_table), "bits are in wrong order"),
-                                           (deepcopy(unordered_bits_table), "bits are in wrong order"),
-                                           (deepcopy(healthy_bits_table), ""),
-                                           (deepcopy(half_bits_table), ""),
-                                           (deepcopy(bytes_table), "bytes are in wrong order"),
-                                           (deepcopy(unordered_bytes_table), "bytes are in wrong order"),
-                                           (deepcopy(healthy_bytes_table), ""),
-                                           (deepcopy(half_bytes_table), "")])
-def test_check_order(table, result, caplog):
-    table.check_order()
-    if result == "":
-        assert caplog.text == ""
+healthy_bytes_rows = (
+    {"bytes": [3,0]},
+    {"bytes": [7,4]},
+    {"bytes": [15,8]},
+    {"bytes": [31,16]},
+)
+
+
+# the range [7,4] lies within [31,0], so [15,12] must not be seen as a hole after it
+nested_bits_rows = (
+    {"bits": [31,0]},
+    {"bits": [7,4]},
+    {"bits": [15,12]},
+)
+
+# the range [4,7] is in the wrong order and must be skipped when checking the ranges
+wrong_order_bits_rows = (
+    {"bits": [31,8]},
+    {"bits": [4,7]},
+    {"bits": [7,0]},
+)
+
+# an overlap is found before the hole, both must be reported
+overlapping_bytes_rows = (
+    {"bytes": [7,0]},
+    {"bytes": [9,4]},
+    {"bytes": [31,16]},
+)
+
+# a range in the wrong order gives a negative sum, which is not a power of 2
+negative_bits_rows = (
+    {"bits": [0,3]},
+)
+
+# sums that math.log didn't recognize as powers of 2
+large_bits_rows = (
+    {"bits": [2**31 - 1, 2**30]},
+    {"bits": [2**30 - 1, 0]},
+)
+
+large_bytes_rows = (
+    {"bytes": [2**28 - 1, 0]},
+    {"bytes": [2**29 - 1, 2**28]},
+)
+
+# values with three parts can't be calculated and are left out of the sum
+three_part_bits_rows = (
+    {"bits": [31,16]},
+    {"bits": [15,0]},
+    {"bits": [7,4,0]},
+)
+
+
+undetected_hex_rows_1 = (
+    {"value": "20h", "description": "This shouldn't be changed 20h"},
+    {"value": "80h", "description": "80h This shouldn't be changed"},
+    {"value": "90h", "description": "This shouldn't 90h be changed"},
+)
+
+detected_hex_rows_1 = (
+    {"hex-value": "20h", "description": "This shouldn't be changed 20h"},
+    {"hex-value": "80h", "description": "80h This shouldn't be changed"},
+    {"hex-value": "90h", "description": "This shouldn't 90h be changed"},
+)
+
+undetected_hex_rows_2 = (
+    {"heading with spaces": "30h to F0h", "description": "This shouldn't be changed 30h to F0h"},
+    {"heading with spaces": "F1h to FAh", "description": "F1h to FAh This shouldn't be changed"},
+    {"heading with spaces": "FBh to 1AAh", "description": "This shouldn't FBh to 1AAh be changed"},
+)
+
+detected_hex_rows_2 = (
+    {"hex-heading with spaces": "30h to F0h", "description": "This shouldn't be changed 30h to F0h"},
+    {"hex-heading with spaces": "F1h to FAh", "description": "F1h to FAh This shouldn't be changed"},
+    {"hex-heading with spaces": "FBh to 1AAh", "description": "This shouldn't FBh to 1AAh be changed"},
+)
+
+undetected_hex_rows_3 = (
+    {"w3i?d he4d1/g": "ABh"},
+    {"w3i?d he4d1/g": "80Ah"},
+    {"w3i?d he4d1/g": "All Others"},
+)
+
+detected_hex_rows_3 = (
+    {"hex-w3i?d he4d1/g": "ABh"},
+    {"hex-w3i?d he4d1/g": "80Ah"},
+    {"hex-w3i?d he4d1/g": "All Others"},
+)
+
+
+check_cases = [
+    (bits_rows, "bits", {"calc": [4, 3, 24, 16],
+                         "order": ["bits are in wrong order"],
+                         "sum": ["sum of bits is not a power of 2"],
+                         "ranges": ["hole in bits", "overlap of bits"]}),
+    (healthy_bits_rows, "bits", {"calc": [16, 8, 4, 4], "order": [], "sum": [], "ranges": []}),
+    (half_bits_rows, "bits", {"calc": [4, 1, 1, 1],
+                              "order": [],
+                              "sum": ["sum of bits is not a power of 2"],
+                              "ranges": []}),
+    (unordered_bits_rows, "bits", {"calc": [8, 16, 4, 4],
+                                   "order": ["bits are in wrong order"],
+                                   "sum": [],
+                                   "ranges": []}),
+    (bytes_rows, "bytes", {"calc": [16, 24, 3, 4],
+                           "order": ["bytes are in wrong order"],
+                           "sum": ["sum of bytes is not a power of 2"],
+                           "ranges": ["hole in bytes", "overlap of bytes"]}),
+    (healthy_bytes_rows, "bytes", {"calc": [4, 4, 8, 16], "order": [], "sum": [], "ranges": []}),
+    (half_bytes_rows, "bytes", {"calc": [1, 1, 1, 4],
+                                "order": [],
+                                "sum": ["sum of bytes is not a power of 2"],
+                                "ranges": []}),
+    (unordered_bytes_rows, "bytes", {"calc": [4, 8, 4, 16],
+                                     "order": ["bytes are in wrong order"],
+                                     "sum": [],
+                                     "ranges": []}),
+    (nested_bits_rows, "bits", {"calc": [32, 4, 4],
+                                "order": ["bits are in wrong order"],
+                                "sum": ["sum of bits is not a power of 2"],
+                                "ranges": ["overlap of bits"]}),
+    (wrong_order_bits_rows, "bits", {"calc": [24, -2, 8],
+                                     "order": ["bits are in wrong order"],
+                                     "sum": ["sum of bits is not a power of 2"],
+                                     "ranges": []}),
+    (overlapping_bytes_rows, "bytes", {"calc": [8, 6, 16],
+                                       "order": [],
+                                       "sum": ["sum of bytes is not a power of 2"],
+                                       "ranges": ["hole in bytes", "overlap of bytes"]}),
+    (negative_bits_rows, "bits", {"calc": [-2],
+                                  "order": [],
+                                  "sum": ["sum of bits is not a power of 2"],
+                                  "ranges": []}),
+    (large_bits_rows, "bits", {"calc": [2**30, 2**30], "order": [], "sum": [], "ranges": []}),
+    (large_bytes_rows, "bytes", {"calc": [2**28, 2**28], "order": [], "sum": [], "ranges": []}),
+    (three_part_bits_rows, "bits", {"calc": [16, 16, [7, 4, 0]],
+                                    "order": [],
+                                    "sum": [],
+                                    "ranges": ["overlap of bits"]}),
+]
+
+
+def assert_warnings(caplog, expected):
+    """Check that exactly the expected warnings were logged and reset the capture"""
+    if not expected:
+        assert not caplog.records
     else:
-        assert result in caplog.text
+        assert len(caplog.record_tuples) == len(expected)
+        for result in expected:
+            assert any(result in message for _, level, message in caplog.record_tuples
+                       if level == logging.WARNING)
+    caplog.clear()
 
 
-@pytest.mark.parametrize("table, result, type", [(deepcopy(bits_table), "sum of bits is not a power of 2", "bits"),
-                                                 (deepcopy(healthy_bits_table), "", "bits"),
-                                                 (deepcopy(half_bits_table), "sum of bits is not a power of 2", "bits"),
-                                                 (deepcopy(bytes_table), "sum of bytes is not a power of 2", "bytes"),
-                                                 (deepcopy(healthy_bytes_table), "", "bytes"),
-                                                 (deepcopy(half_bytes_table), "sum of bytes is not a power of 2", "bytes")])
-def test_check_sum(table, result, type, caplog):
+@pytest.mark.parametrize("rows, type, expected", check_cases)
+def test_checks(rows, type, expected, caplog):
+    table = new_table(rows)
+    table.check_order()
+    assert_warnings(caplog, expected["order"])
+
+    table = new_table(rows)
+    table.check_ranges(type)
+    assert_warnings(caplog, expected["ranges"])
+
+    table = new_table(rows)
     table.calculate_bits_and_bytes(type)
+    assert [row[type] for row in table.rows] == expected["calc"]
     table.check_sum(type)
-    if result == "":
-        assert caplog.text == ""
-    else:
-        assert result in caplog.text
-
-
-@pytest.mark.parametrize("table, result, type", [(deepcopy(bits_table), "overlap of bits", "bits"),
-                                                 (deepcopy(healthy_bits_table), "", "bits"),
-                                                 (deepcopy(half_bits_table), "", "bits"),
-                                                 (deepcopy(bytes_table), "overlap of bytes", "bytes"),
-                                                 (deepcopy(half_bytes_table), "", "bytes"),
-                                                 (deepcopy(healthy_bytes_table), "", "bytes")])
-def test_check_overlap(table, result, type, caplog):
-    table.check_overlap(type)
-    if result == "":
-        assert caplog.text == ""
-    else:
-        assert result in caplog.text
-
-
-@pytest.mark.parametrize("table, result, type", [(deepcopy(bits_table), "hole in bits", "bits"),
-                                                 (deepcopy(healthy_bits_table), "", "bits"),
-                                                 (deepcopy(half_bits_table), "", "bits"),
-                                                 (deepcopy(bytes_table), "hole in bytes", "bytes"),
-                                                 (deepcopy(half_bytes_table), "", "bytes"),
-                                                 (deepcopy(healthy_bytes_table), "", "bytes")])
-def test_check_for_holes(table, result, type, caplog):
-    table.check_for_holes(type)
-    if result == "":
-        assert caplog.text == ""
-    else:
-        assert result in caplog.text
+    assert_warnings(caplog, expected["sum"])
 
 
-def test_detect_hex_columns():
-    undetected_hex_table_1 = transformer.Table("test table", [
-        {"value": "20h", "description": "This shouldn't be changed 20h"},
-        {"value": "80h", "description": "80h This shouldn't be changed"},
-        {"value": "90h", "description": "This shouldn't 90h be changed"},
+def test_generate_name(caplog):
+    caplog.set_level(logging.DEBUG, logger="Transformer")
+    table = transformer.Table("test table", [
+        {"bits": [3,0], "brief": "Some Field"},
+        {"value": "20h", "brief": "Some Value"},
+        {"bits": [4], "name": "kept", "brief": "Named Field"},
+        {"bits": [7,5], "description": "Reserved"},
     ])
+    table.generate_name()
 
-    detected_hex_table_1 = transformer.Table("test table", [
-        {"hex-value": "20h", "description": "This shouldn't be changed 20h"},
-        {"hex-value": "80h", "description": "80h This shouldn't be changed"},
-        {"hex-value": "90h", "description": "This shouldn't 90h be changed"},
-    ])
+    assert [row["name"] for row in table.rows] == ["some_field", "some_value", "kept", "rsvd"]
+    # only fields with bits or bytes are expected to have a name
+    assert caplog.record_tuples == [("Transformer", logging.DEBUG, "test table: field Some Field is missing name")]
 
-    undetected_hex_table_2 = transformer.Table("test table", [
-        {"heading with spaces": "30h to F0h", "description": "This shouldn't be changed 30h to F0h"},
-        {"heading with spaces": "F1h to FAh", "description": "F1h to FAh This shouldn't be changed"},
-        {"heading with spaces": "FBh to 1AAh", "description": "This shouldn't FBh to 1AAh be changed"},
-    ])
-    detected_hex_table_2 = transformer.Table("test table", [
-        {"hex-heading with spaces": "30h to F0h", "description": "This shouldn't be changed 30h to F0h"},
-        {"hex-heading with spaces": "F1h to FAh", "description": "F1h to FAh This shouldn't be changed"},
-        {"hex-heading with spaces": "FBh to 1AAh", "description": "This shouldn't FBh to 1AAh be changed"},
-    ])
 
-    undetected_hex_table_3 = transformer.Table("test table", [
-        {"w3i?d he4d1/g": "ABh"},
-        {"w3i?d he4d1/g": "80Ah"},
-        {"w3i?d he4d1/g": "All Others"},
-    ])
-    detected_hex_table_3 = transformer.Table("test table", [
-        {"hex-w3i?d he4d1/g": "ABh"},
-        {"hex-w3i?d he4d1/g": "80Ah"},
-        {"hex-w3i?d he4d1/g": "All Others"},
+def test_calculate_bits_and_bytes(caplog):
+    caplog.set_level(logging.DEBUG, logger="Transformer")
+    table = transformer.Table("test table", [
+        {"bits": [3,0]},
+        {"bits": []},
+        {"bits": [7,4,0]},
+        {"bits": ["1Ah"]},
     ])
+    table.calculate_bits_and_bytes("bits")
+
+    assert [row["bits"] for row in table.rows] == [4, [], [7, 4, 0], ["1Ah"]]
+    assert [message for _, _, message in caplog.record_tuples] == [
+        "test table: unexpected bits value []",
+        "test table: unexpected bits value [7, 4, 0]",
+        "test table contains non integer values in bits column",
+    ]
+
+
+def test_clean_bits_and_bytes():
+    table = new_table(three_part_bits_rows)
+    table.clean_bits_and_bytes()
 
-    undetected_hex_table_1.detect_hex_columns()
-    undetected_hex_table_2.detect_hex_columns()
-    undetected_hex_table_3.detect_hex_columns()
+    assert table.rows == [{"bits": 16}, {"bits": 16}]
+
+
+@pytest.mark.parametrize("rows_in, rows_out", [(undetected_hex_rows_1, detected_hex_rows_1),
+                                              (undetected_hex_rows_2, detected_hex_rows_2),
+                                              (undetected_hex_rows_3, detected_hex_rows_3)])
+def test_detect_hex_columns(rows_in, rows_out):
+    table = transformer.Table("test table", [dict(row) for row in rows_in])
+    table.detect_hex_columns()
+
+    assert table.rows == list(rows_out)
+    assert table.headings == list(rows_out[0])
+
+
+def test_clean_hex():
+    table = transformer.Table("test table", [
+        {"value": "20h"},
+        {"value": "30h to 3Fh"},
+        {"brief": "Reserved"},
+        {"value": "40h"},
+    ])
+    table.clean_hex()
 
-    assert(undetected_hex_table_1.rows == detected_hex_table_1.rows)
-    assert(undetected_hex_table_1.headings == detected_hex_table_1.headings)
-    assert(undetected_hex_table_2.rows == detected_hex_table_2.rows)
-    assert(undetected_hex_table_2.headings == detected_hex_table_2.headings)
-    assert(undetected_hex_table_3.rows == detected_hex_table_3.rows)
-    assert(undetected_hex_table_3.headings == detected_hex_table_3.headings)
+    assert table.rows == [{"hex-value": "0x20"}, {"hex-value": "0x40"}]